@@ -10,12 +10,13 @@ from gpytorch.mlls import ExactMarginalLogLikelihood
 from gpytorch.kernels import AdditiveKernel
 import gc
 import copy
+import warnings
 
 def train_to_convergence(model, xs, ys,
                          optimizer: Optional[Type]=None, lr=0.1, objective=None,
                          max_iter=100, verbose=0, patience=20,
                          conv_tol=1e-4, check_conv=True, smooth=True,
-                         isloss=False, batch_size=None, checkpoint=False, print_freq=1):
+                         isloss=False, batch_size=None, checkpoint=False, print_freq=1, compile_objective=False):
     """The core optimization routine
 
     :param model: the model (usually a GPyTorch model, usually an ExactGP model) to fit
@@ -32,12 +33,24 @@ def train_to_convergence(model, xs, ys,
     :param smooth: If True, use a moving average to smooth the losses over epochs for checking convergence
     :param isloss: If True, the objective is considered a loss and is minimized. Otherwise, obj is maximized.
     :param batch_size: If not None, break the data into mini-batches of size batch_size
+    :param compile_objective: If True, evaluate the model and objective through torch.compile (PyTorch 2.0+)
     :return:
     """
     if optimizer is None:
         optimizer = torch.optim.LBFGS
     verbose = int(verbose)
 
+    def evaluate_objective(x, y):
+        return objective(model(x), y)
+
+    if compile_objective:
+        if hasattr(torch, 'compile'):
+            # The graph is fixed for the whole run, so it's only traced once. Parts torch.compile can't handle
+            # (e.g. data-dependent CG iterations) just fall back to eager mode.
+            evaluate_objective = torch.compile(evaluate_objective)
+        else:
+            warnings.warn("torch.compile is not available in this version of PyTorch, not compiling the objective.")
+
     train_dataset = TensorDataset(xs, ys)
 
     shuffle = not(batch_size is None)
@@ -64,11 +77,10 @@ def train_to_convergence(model, xs, ys,
             #     other optimizers like ADAM too.
             def closure():
                 optimizer_.zero_grad()
-                output = model(x_batch)
                 if isloss:
-                    loss = objective(output, y_batch)
+                    loss = evaluate_objective(x_batch, y_batch)
                 else:
-                    loss = -objective(output, y_batch)
+                    loss = -evaluate_objective(x_batch, y_batch)
                 loss.backward()
                 return loss
             loss = optimizer_.step(closure).item()
@@ -6,28 +6,57 @@ import time
 import datetime
 import traceback
 import os
+import gc
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 from scipy.io import loadmat
 import json
 import gpytorch
+from gpytorch.utils.errors import NanError
 from config import data_base_path
 
+# Models grow with J over an ablation sweep, which fragments the default CUDA caching allocator. Expandable
+# segments avoid that; the option only exists from torch 2.1 (older versions reject it). The allocator reads
+# this lazily on first CUDA use, so setting it after importing torch is fine.
+if tuple(int(v) for v in torch.__version__.split('.')[:2]) >= (2, 1):
+    os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True')
+
 from fitting.optimizing import mean_squared_error
 import training_routines
+from utils import _atomic_torch_save
+
+def _load_mat_data(path):
+    """Helper to read the 'data' matrix of a .mat file, using h5py for MATLAB v7.3 (HDF5) files."""
+    try:
+        return loadmat(path, variable_names=['data'])['data']
+    except NotImplementedError:  # scipy can't read v7.3 files
+        import h5py
+        with h5py.File(path, 'r') as f:
+            return f['data'][()].T  # HDF5 stores MATLAB arrays transposed
+
 
 def load_dataset(name: str):
     """Helper method to load a given UCI dataset
     Loads data from .mat files at path <data_base_path>/uci/<name>.mat
     """
-    mat = loadmat(os.path.join(data_base_path, 'uci', name, '{}.mat'.format(name)))
-    [n, d] = mat['data'].shape
-    df = pd.DataFrame(mat['data'],
-                      columns=list(range(d-1))+['target'])
-    df.columns = [str(c) for c in df.columns]
+    data = _load_mat_data(os.path.join(data_base_path, 'uci', name, '{}.mat'.format(name)))
+    # Models train in single precision anyway, so store float32 to halve memory and bytes moved downstream.
+    data = data.astype(np.float32, copy=False)
+    [n, d] = data.shape
+
+    # Standardize the target in place on the raw array rather than with whole-column pandas ops.
+    target = data[:, -1]
+    target -= np.nanmean(target, dtype=np.float64)
+    sigma = np.nanstd(target, ddof=1, dtype=np.float64)  # ddof=1 to match pandas.
+    if sigma > 0:
+        target /= sigma
+
+    df = pd.DataFrame(data, columns=[str(c) for c in list(range(d-1))+['target']], copy=False)
     df = df.reset_index()
 
-    df['target'] = df['target'] - df['target'].mean()
-    df['target'] = df['target']/(df['target'].std())
-
     df = df.dropna(axis=1, how='all')
 
     return df
@@ -78,30 +107,172 @@ def _determine_folds(split, dataset):
 
 def _access_fold(dataset, fold_starts, fold):
     """Pull out the test and train set of a dataset using existing fold division"""
-    train = dataset.iloc[0:fold_starts[fold]]  # if fold=0, none before fold
+    # Gather the train rows with one index array so the train set is copied once rather than sliced and concatenated.
+    train_idx = np.concatenate([np.arange(0, fold_starts[fold]),  # if fold=0, none before fold
+                                np.arange(fold_starts[fold + 1], len(dataset))])
+    train = dataset.iloc[train_idx]
     test = dataset.iloc[fold_starts[fold]:fold_starts[fold + 1]]
-    train = pd.concat([train, dataset.iloc[fold_starts[fold + 1]:]])
     return train, test
 
 
-def _normalize_by_train(train, test):
-    """Mean and std normalize using mean and std of the train set."""
+def _normalize_inplace(train_mat, test_mat):
+    """Standardize the columns of both arrays in place using the mean and std (ddof=1, to match pandas) of train_mat.
+
+    The std is taken from the already-centered train array, so no n x d temporaries are allocated
+    (ndarray.std makes two). Constant columns are left unscaled. Statistics are accumulated in float64
+    even for float32 arrays.
+    """
+    n = train_mat.shape[0]
+    mu = train_mat.mean(axis=0, dtype=np.float64)
+    train_mat -= mu
+    test_mat -= mu
+    sigma = np.sqrt(np.einsum('ij,ij->j', train_mat, train_mat, dtype=np.float64) / max(n - 1, 1))
+    sigma[~(sigma > 0)] = 1.
+    train_mat /= sigma
+    test_mat /= sigma
+
+
+def _get_features(columns, target_col='target'):
+    """The feature columns of a dataset: everything but the target and the index."""
+    return [x for x in columns if (x != target_col and x.lower() != 'index')]
+
+
+def _normalize_by_train(train, test, features=None, target_col='target'):
+    """Mean and std normalize using mean and std of the train set.
+    The feature columns are derived from the train set unless given."""
     train = train.copy()
     test = test.copy()
-    cols = list(train.columns)
-    features = [x for x in cols if (x != 'target' and x.lower() != 'index')]
-    mu = train[features + ['target']].mean()
-
-    train.loc[:, features + ['target']] -= mu
-    test.loc[:, features + ['target']] -= mu
-    for f in features + ['target']:
-        sigma = train[f].std()
-        if sigma > 0:
-            train.loc[:, f] /= sigma
-            test.loc[:, f] /= sigma
+    if features is None:
+        features = _get_features(train.columns, target_col)
+    cols = list(features) + [target_col]
+
+    # Work on the raw arrays so all columns are handled in one broadcast instead of one pandas op per column.
+    # Keep float32 data in float32; anything else (e.g. integer columns) is normalized in float64.
+    train_sub = train[cols]
+    dtype = np.result_type(np.float32, *train_sub.dtypes)
+    train_mat = train_sub.to_numpy(dtype=dtype, copy=True)
+    test_mat = test[cols].to_numpy(dtype=dtype, copy=True)
+    _normalize_inplace(train_mat, test_mat)
+    train[cols] = train_mat
+    test[cols] = test_mat
     return train, test
 
 
+# Columns every successful result row has, in the order they appear in the results.
+_COMMON_COLS = ('fold', 'repeat', 'n', 'd', 'mse', 'rmse', 'train_time')
+
+
+def _to_tensor(frame):
+    """Convert a DataFrame/Series to a contiguous float tensor, casting straight to float32 and sharing its buffer."""
+    return torch.from_numpy(np.ascontiguousarray(frame.to_numpy(dtype=np.float32)))
+
+
+def _fold_tensors(dataset, features, fold_starts, fold, normalize_using_train, target_col='target'):
+    """Split out a fold, optionally normalize it, and return its train/test tensors and the dataset size."""
+    train, test = _access_fold(dataset, fold_starts, fold)
+    if normalize_using_train:
+        train, test = _normalize_by_train(train, test, features, target_col)
+    return dict(trainX=_to_tensor(train[features]), trainY=_to_tensor(train[target_col]),
+                testX=_to_tensor(test[features]), testY=_to_tensor(test[target_col]), n=len(dataset))
+
+
+def _fold_cache_path(cache_dir, name, split, fold, normalize_using_train):
+    return os.path.join(cache_dir, '{}_{}_{}{}.pt'.format(name, split, fold, '' if normalize_using_train else '_raw'))
+
+
+def _cached_fold_tensors(cache_path, dataset, features, fold_starts, fold, normalize_using_train):
+    """Load a fold's tensors from cache_path, building and saving them there first if they aren't cached yet."""
+    if os.path.exists(cache_path):
+        return torch.load(cache_path, map_location='cpu')
+    tensors = _fold_tensors(dataset, features, fold_starts, fold, normalize_using_train)
+    _atomic_torch_save(tensors, cache_path)
+    return tensors
+
+
+def _run_fold(fold, dataset, features, fold_starts, n_folds, cache_path, training_routine, training_options,
+              addl_metrics, repeats, error_repeats, normalize_using_train, t0, print_to_console):
+    """Train and evaluate a model on a single fold (retrying on errors) and return a list of result dicts."""
+    results_list = []
+    # These don't depend on the retry, so build them once per fold.
+    if cache_path is None:
+        tensors = _fold_tensors(dataset, features, fold_starts, fold, normalize_using_train)
+    else:
+        tensors = _cached_fold_tensors(cache_path, dataset, features, fold_starts, fold, normalize_using_train)
+    trainX, trainY, testX, testY = tensors['trainX'], tensors['trainY'], tensors['testX'], tensors['testY']
+    if torch.cuda.is_available() and any('cuda' in str(device) for device in training_options.get('devices', ())):
+        # Page-locked host tensors let the training routines copy them to the GPU asynchronously.
+        trainX, trainY, testX, testY = (t.pin_memory() for t in (trainX, trainY, testX, testY))
+    n, d = tensors['n'], trainX.shape[-1]
+    succeed = False
+    n_errors = 0
+    while not succeed and n_errors < error_repeats:
+        for repeat in range(repeats):
+            result_dict = {'fold': fold,
+                           'repeat': repeat,
+                           'n': n,
+                           'd': d}
+
+            start = time.perf_counter()
+            try:
+                ret = training_routine(trainX, trainY, testX,
+                                                        testY,
+                                                        **training_options)
+            except (RuntimeError, NanError, np.linalg.LinAlgError):  # e.g. failed Cholesky, NaNs in CG
+                result_dict = dict(error=traceback.format_exc(),
+                              fold=fold,
+                              n=n,
+                              d=d-2,
+                                   mse=np.nan, rmse=np.nan)
+                print(result_dict)
+                traceback.print_exc()
+                results_list.append(result_dict)
+                n_errors += 1
+                print('errors: ', n_errors)
+                break
+            model_metrics = ret[0]
+            ypred = ret[1]
+            end = time.perf_counter()
+
+            result_dict['mse'] = mean_squared_error(ypred, testY)
+            result_dict['rmse'] = np.sqrt(result_dict['mse'])
+            result_dict['train_time'] = end - start
+
+            # e.g. -ll, -mll
+            for name, value in model_metrics.items():
+                result_dict[name] = value
+
+            # e.g. mae, ...
+            for name, fxn in addl_metrics.items():
+                result_dict[name] = fxn(ypred, testY)
+            results_list.append(result_dict)
+            succeed = True
+            t = time.time()
+            elapsed = t - t0
+            num_finished = fold*repeats+repeat+1
+            num_remaining = n_folds*repeats - num_finished
+            eta = datetime.timedelta(seconds=elapsed/num_finished*num_remaining)
+            if print_to_console:
+                print('{}, fold={}, rep={}, eta={} \n{}'.format(datetime.datetime.now(), fold, repeat, format_timedelta(eta), result_dict))
+
+            # print("succeed: ", succeed)
+    return results_list
+
+
+def _init_worker(initializer, initargs, fold_args, run_args):
+    """Process pool initializer: one torch thread per worker to avoid oversubscription, then any user initializer.
+    The arguments shared by every fold (including the dataset) are stored once per worker rather than sent per fold."""
+    global _worker_fold_args, _worker_run_args
+    torch.set_num_threads(1)
+    _worker_fold_args, _worker_run_args = fold_args, run_args
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_worker_fold(fold, cache_path):
+    """Run a fold in a worker process, using the shared arguments stored by _init_worker."""
+    return _run_fold(fold, *_worker_fold_args, cache_path, *_worker_run_args)
+
+
 def run_experiment(training_routine: Callable,
                    training_options: Dict,
                    dataset: Union[str, pd.DataFrame],
@@ -112,7 +283,11 @@ def run_experiment(training_routine: Callable,
                    error_repeats=10,
                    normalize_using_train=True,
                    chosen_fold=0,
-                   print_to_console=True
+                   print_to_console=True,
+                   n_jobs=1,
+                   worker_initializer: Callable=None,
+                   worker_initargs=(),
+                   cache_dir=None
                    ):
     """Main function to run a model on a dataset.
 
@@ -131,94 +306,115 @@ def run_experiment(training_routine: Callable,
     Note that if the dataset if provided, it is assumed to be sufficiently
     shuffled already.
 
+    Folds are independent, so with n_jobs > 1 (or n_jobs=-1 for all cores) they are run in a pool of
+    worker processes. Workers are spawned fresh, so any global state (e.g. gpytorch.settings context
+    managers) must be re-established by worker_initializer(*worker_initargs).
+
+    If cache_dir is given and the dataset is given by name, each fold's (normalized) train/test tensors are
+    saved there on first use and loaded from there afterwards, skipping loading and splitting the dataset.
+
     :param training_routine:
     :param training_options:
     :param addl_metrics:
     :param dataset:
     :param split:
     :param cv:
+    :param n_jobs: number of worker processes to run folds in. 1 runs folds sequentially in this process.
+    :param worker_initializer: called with worker_initargs in each worker process before running folds
+    :param cache_dir: directory to cache fold tensors in (only used if dataset is a name)
     :return: results_list
     """
 
+    n_folds = int(round(1 / split))  # matches _determine_folds
+    folds = [fold for fold in range(n_folds) if cv or fold == chosen_fold]  # only do one fold if you're not doing CV
+
+    cache_paths = [None for _ in folds]
+    if cache_dir is not None and isinstance(dataset, str):
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_paths = [_fold_cache_path(cache_dir, dataset, split, fold, normalize_using_train) for fold in folds]
+        if all(os.path.exists(path) for path in cache_paths):
+            dataset = None  # everything is cached, so skip loading the dataset at all
+
     if isinstance(dataset, str):
         dataset = load_dataset(dataset)
 
-    cols = list(dataset.columns)
-    features = [x for x in cols if (x != 'target' and x.lower() != 'index')]
-
-    fold_starts = _determine_folds(split, dataset)
-    n_folds = len(fold_starts) - 1
+    if dataset is not None:
+        features = _get_features(dataset.columns)  # computed once, reused by every fold
+        fold_starts = _determine_folds(split, dataset)
+    else:
+        features, fold_starts = None, None
 
-    results_list = []
     t0 = time.time()
-    for fold in range(n_folds):
-        if not cv and fold != chosen_fold:  # only do one fold if you're not doing CV
-            continue
-        train, test = _access_fold(dataset, fold_starts, fold)
-        if normalize_using_train:
-            train, test = _normalize_by_train(train, test)
-        succeed = False
-        n_errors = 0
-        while not succeed and n_errors < error_repeats:
-            try:
-                trainX = torch.tensor(train[features].values, dtype=torch.float).contiguous()
-                trainY = torch.tensor(train['target'].values, dtype=torch.float).contiguous()
-                testX = torch.tensor(test[features].values, dtype=torch.float).contiguous()
-                testY = torch.tensor(test['target'].values, dtype=torch.float).contiguous()
-
-                for repeat in range(repeats):
-                    result_dict = {'fold': fold,
-                                   'repeat': repeat,
-                                   'n': len(dataset),
-                                   'd': len(features)}
-
-                    start = time.perf_counter()
-                    ret = training_routine(trainX, trainY, testX,
-                                                            testY,
-                                                            **training_options)
-                    model_metrics = ret[0]
-                    ypred = ret[1]
-                    end = time.perf_counter()
-
-                    result_dict['mse'] = mean_squared_error(ypred, testY)
-                    result_dict['rmse'] = np.sqrt(result_dict['mse'])
-                    result_dict['train_time'] = end - start
-
-                    # e.g. -ll, -mll
-                    for name, value in model_metrics.items():
-                        result_dict[name] = value
-
-                    # e.g. mae, ...
-                    for name, fxn in addl_metrics.items():
-                        result_dict[name] = fxn(ypred, testY)
-                    results_list.append(result_dict)
-                    succeed = True
-                    t = time.time()
-                    elapsed = t - t0
-                    num_finished = fold*repeats+repeat+1
-                    num_remaining = n_folds*repeats - num_finished
-                    eta = datetime.timedelta(seconds=elapsed/num_finished*num_remaining)
-                    if print_to_console:
-                        print('{}, fold={}, rep={}, eta={} \n{}'.format(datetime.datetime.now(), fold, repeat, format_timedelta(eta), result_dict))
-
-                    # print("succeed: ", succeed)
-            except Exception:
-                result_dict = dict(error=traceback.format_exc(),
-                              fold=fold,
-                              n=len(dataset),
-                              d=len(features)-2,
-                                   mse=np.nan, rmse=np.nan)
-                print(result_dict)
-                traceback.print_exc()
-                results_list.append(result_dict)
-                n_errors += 1
-                print('errors: ', n_errors)
-
-    results = pd.DataFrame(results_list)
+    fold_args = (dataset, features, fold_starts, n_folds)
+    run_args = (training_routine, training_options, addl_metrics,
+                repeats, error_repeats, normalize_using_train, t0, print_to_console)
+    if n_jobs < 1:
+        n_jobs = os.cpu_count()
+    n_jobs = min(n_jobs, len(folds))
+    if n_jobs <= 1:
+        fold_results = [_run_fold(fold, *fold_args, cache_path, *run_args) for fold, cache_path in zip(folds, cache_paths)]
+    else:
+        # spawn rather than fork so that workers don't inherit CUDA/threading state from this process.
+        with ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(worker_initializer, worker_initargs, fold_args, run_args)) as executor:
+            fold_results = list(executor.map(_run_worker_fold, folds, cache_paths))
+    results_list = [result_dict for fold_result in fold_results for result_dict in fold_result]
+
+    # Successful rows share their keys, so build them as tuples under one fixed column order; the (rare) error
+    # rows have different keys and are added with a single concat.
+    successes = [r for r in results_list if 'error' not in r]
+    errors = [r for r in results_list if 'error' in r]
+    columns = list(_COMMON_COLS) + list(dict.fromkeys(k for r in successes for k in r if k not in _COMMON_COLS))
+    results = pd.DataFrame([tuple(r.get(c, np.nan) for c in columns) for r in successes], columns=columns)
+    if len(errors) > 0:
+        results = pd.concat([results, pd.DataFrame(errors)], ignore_index=True, sort=False)
     print('Mean RMSE = {}'.format(results['rmse'].mean()))
     return results
 
 
+def _checkpoint_writer(checkpoints, path):
+    """Write result frames taken from the checkpoints queue to a csv at path until None is received.
+
+    Only the new rows are appended each time. The file is rewritten only when new columns show up
+    (e.g. the first error), since the header must change.
+    """
+    frames = []
+    csv_columns = []
+    while True:
+        results = checkpoints.get()
+        if results is None:
+            return
+        frames.append(results)
+        if set(results.columns) <= set(csv_columns):
+            results.reindex(columns=csv_columns).to_csv(path, mode='a', header=False)
+        else:
+            checkpoint = pd.concat(frames)
+            checkpoint.to_csv(path)
+            csv_columns = list(checkpoint.columns)
+
+
+def _gpytorch_settings(args):
+    """Enter the GPyTorch settings requested on the command line, returned as a single context manager."""
+    stack = ExitStack()
+    stack.enter_context(gpytorch.settings.cg_tolerance(args.cg_tol))
+    stack.enter_context(gpytorch.settings.eval_cg_tolerance(args.eval_cg_tol))
+    stack.enter_context(gpytorch.settings.fast_computations(not args.use_chol, not args.use_chol, not args.use_chol))
+    stack.enter_context(gpytorch.settings.fast_pred_var(args.fast_pred))
+    stack.enter_context(gpytorch.settings.use_toeplitz(args.use_toeplitz))
+    stack.enter_context(gpytorch.settings.max_cg_iterations(args.max_cg_iterations))
+    stack.enter_context(gpytorch.beta_features.checkpoint_kernel(args.checkpoint_kernel))
+    stack.enter_context(gpytorch.settings.skip_logdet_forward(args.skip_log_det_forward))
+    stack.enter_context(gpytorch.settings.memory_efficient(args.memory_efficient))
+    return stack
+
+
+def _enter_gpytorch_settings(args):
+    """Worker initializer: apply the command line GPyTorch settings for the lifetime of the worker process."""
+    global _worker_settings
+    _worker_settings = _gpytorch_settings(args)
+
+
 if __name__ == '__main__':
     import json
     import argparse
@@ -250,6 +446,8 @@ if __name__ == '__main__':
     parser.add_argument('--checkpoint_kernel', type=int, default=0, required=False, help='Split kernel into chunks')
     parser.add_argument('--record_pred_unc', action='store_true', required=False, help='Record predictive uncertainty metrics.')
     parser.add_argument('--double', action='store_true', required=False, help='Run experiments in double precision rather than float.')
+    parser.add_argument('--cache_dir', type=str, default=None, required=False, help='Directory to cache normalized fold tensors in.')
+    parser.add_argument('--n_jobs', type=int, default=1, required=False, help='Number of processes to run folds in (-1 for all cores).')
 
     args = parser.parse_args()
 
@@ -317,65 +515,94 @@ if __name__ == '__main__':
     if options['record_pred_unc'] and options['skip_posterior_variances']:
         raise ValueError("Can't record predictive uncertainty while skipping posterior variances.")
 
+    if ppr:
+        routine = training_routines.train_ppr_gp
+    elif cgp:
+        routine = training_routines.train_compressed_gp
+    elif ma:
+        routine = training_routines.train_exact_gp_model_average
+    else:
+        routine = training_routines.train_exact_gp
 
-    df = pd.DataFrame()
-    for dataset in datasets:
-        print('Starting dataset {}'.format(dataset))
-        with gpytorch.settings.cg_tolerance(args.cg_tol), \
-              gpytorch.settings.eval_cg_tolerance(args.eval_cg_tol), \
-              gpytorch.settings.fast_computations(not args.use_chol, not args.use_chol, not args.use_chol), \
-              gpytorch.settings.fast_pred_var(args.fast_pred), \
-              gpytorch.settings.use_toeplitz(args.use_toeplitz), \
-              gpytorch.settings.max_cg_iterations(args.max_cg_iterations), \
-              gpytorch.beta_features.checkpoint_kernel(args.checkpoint_kernel), \
-              gpytorch.settings.skip_logdet_forward(args.skip_log_det_forward), \
-              gpytorch.settings.memory_efficient(args.memory_efficient):
-            if args.ablation:
-                if args.k is not None:
-                    abl_vars = args.k
-                elif args.J is not None:
-                    abl_vars = args.J
-                else:
-                    abl_vars = [1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377]
+    if args.ablation:
+        if args.k is not None:
+            abl_vars = args.k
+        elif args.J is not None:
+            abl_vars = args.J
+        else:
+            abl_vars = [1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377]
+    else:
+        abl_vars = [-1]
+
+    # The options only depend on the ablation value, so serialize them once up front instead of per dataset.
+    abl_options = []
+    for abl_val in abl_vars:
+        if args.ablation:
+            if args.k is None:
+                options['model_kwargs']['J'] = abl_val
+            else:
+                options['model_kwargs']['k'] = abl_val  # TODO: check this is right.
+        options_json = json.dumps(options)
+        abl_options.append((abl_val, json.loads(options_json), options_json))
+
+    frames = []
+    # Checkpoints are written on a separate thread so that disk I/O doesn't hold up the next experiment.
+    checkpoints = queue.Queue()
+    writer = threading.Thread(target=_checkpoint_writer, args=(checkpoints, args.output))
+    writer.start()
+    # Load the next dataset in the background while the current one trains. With a fold cache, pass names
+    # instead so that run_experiment only loads datasets whose folds aren't cached yet.
+    loader = ThreadPoolExecutor(max_workers=1)
+    # Always drain the writer and stop the loader, so queued checkpoints are written even if a run fails.
+    try:
+        if args.cache_dir is None:
+            next_data = loader.submit(load_dataset, datasets[0])
+        for i, dataset in enumerate(datasets):
+            print('Starting dataset {}'.format(dataset))
+            # Load once per dataset rather than once per ablation value.
+            if args.cache_dir is None:
+                data = next_data.result()
+                if i + 1 < len(datasets):
+                    next_data = loader.submit(load_dataset, datasets[i + 1])
             else:
-                abl_vars = [-1]
-
-            for abl_val in abl_vars:
-                if args.ablation:
-                    if args.k is None:
-                        options['model_kwargs']['J'] = abl_val
-                    else:
-                        options['model_kwargs']['k'] = abl_val  # TODO: check this is right.
-
-                if ppr:
-                    routine = training_routines.train_ppr_gp
-                elif cgp:
-                    routine = training_routines.train_compressed_gp
-                elif ma:
-                    routine = training_routines.train_exact_gp_model_average
-                else:
-                    routine = training_routines.train_exact_gp
-
-                results = run_experiment(routine, options,
-                               dataset, split=args.split, cv=args.cv, repeats=args.repeats,
-                                         normalize_using_train=True, chosen_fold=args.fold,
-                                         error_repeats=args.error_repeats)
-                if args.ablation:
-                    if args.k is None:
-                        results['J'] = abl_val
-                    else:
-                        results['k'] = abl_val
-
-                results['dataset'] = dataset
-                results['options'] = json.dumps(options)
-                results['cg_tol'] = args.cg_tol
-                results['eval_cg_tol']= args.eval_cg_tol
-                results['use_chol'] = args.use_chol
-                results['max_cg_iterations'] = args.max_cg_iterations
-                results['use_toeplitz'] = args.use_toeplitz
-                results['fast_pred_var'] = args.fast_pred
-                results['checkpoint_kernel'] = args.checkpoint_kernel
-                results['skip_log_det_forward'] = args.skip_log_det_forward
-                results['memory_efficient'] = args.memory_efficient
-                df = pd.concat([df, results])
-                df.to_csv(args.output)
+                data = dataset
+            with _gpytorch_settings(args):
+                for abl_val, abl_opts, options_json in abl_options:
+                    results = run_experiment(routine, abl_opts,
+                                   data, split=args.split, cv=args.cv, repeats=args.repeats,
+                                             normalize_using_train=True, chosen_fold=args.fold,
+                                             error_repeats=args.error_repeats, n_jobs=args.n_jobs,
+                                             worker_initializer=_enter_gpytorch_settings, worker_initargs=(args,),
+                                             cache_dir=args.cache_dir)
+                    if args.ablation:
+                        if args.k is None:
+                            results['J'] = abl_val
+                        else:
+                            results['k'] = abl_val
+
+                    results['dataset'] = dataset
+                    results['options'] = options_json
+                    results['cg_tol'] = args.cg_tol
+                    results['eval_cg_tol']= args.eval_cg_tol
+                    results['use_chol'] = args.use_chol
+                    results['max_cg_iterations'] = args.max_cg_iterations
+                    results['use_toeplitz'] = args.use_toeplitz
+                    results['fast_pred_var'] = args.fast_pred
+                    results['checkpoint_kernel'] = args.checkpoint_kernel
+                    results['skip_log_det_forward'] = args.skip_log_det_forward
+                    results['memory_efficient'] = args.memory_efficient
+                    frames.append(results)
+                    checkpoints.put(results)
+
+            # Reclaim the previous dataset's tensors once per dataset (not per fold, which would be too costly)
+            # so garbage doesn't accumulate and fragment GPU memory over a long sweep.
+            del data, results
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+    finally:
+        loader.shutdown()
+        checkpoints.put(None)
+        writer.join()
+    df = pd.concat(frames)
+    df.to_csv(args.output)
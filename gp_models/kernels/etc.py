@@ -4,9 +4,34 @@ from torch.nn import functional as F
 
 
 def _sample_from_range(num_samples, range_):
+    if range_[0] == range_[1]:  # e.g. the default (1., 1.); no need to draw anything
+        return torch.full((num_samples,), float(range_[0]))
     return torch.rand(num_samples) * (range_[1] - range_[0]) + range_[0]
 
 
+class SparseSignProjection(nn.Module):
+    """Linear map (no bias) by a sparse random projection given in COO form (see rp.gen_sparse_sign).
+    Computed as a gather and index_add_ over the nonzeros instead of a dense matmul."""
+    def __init__(self, in_features, out_features, rows, cols, values):
+        super(SparseSignProjection, self).__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer('rows', rows)
+        self.register_buffer('cols', cols)
+        self.register_buffer('values', values)
+
+    def forward(self, x):
+        out = x.new_zeros(*x.shape[:-1], self.out_features)
+        return out.index_add_(x.dim() - 1, self.cols, x[..., self.rows] * self.values)
+
+    @property
+    def weight(self):
+        """Dense out_features x in_features matrix, matching nn.Linear.weight"""
+        W = self.values.new_zeros(self.out_features, self.in_features)
+        W[self.cols, self.rows] = self.values
+        return W
+
+
 class DNN(torch.nn.Module):
     """Note: linear output"""
     def __init__(self, input_dim, output_dim, hidden_layer_sizes, nonlinearity='relu', output_activation='linear',
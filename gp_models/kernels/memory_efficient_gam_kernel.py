@@ -1,5 +1,21 @@
 import gpytorch
+from gpytorch.kernels.keops.keops_kernel import KeOpsKernel
+from gpytorch.lazy import KeOpsLazyTensor
 import torch
+from pykeops.torch import LazyTensor as KEOLazyTensor
+
+
+def _gam_accumulate(x1_, x2_, out):
+    """Add the sum over dimensions of the (unit lengthscale) RBF kernels between x1_ and x2_ to out (n x m).
+    One n x m scratch buffer is reused across dimensions rather than allocating a fresh temporary per dimension.
+    """
+    n = x1_.shape[0]
+    scratch = torch.empty_like(out)
+    with torch.no_grad():
+        for i in range(x1_.shape[1]):
+            torch.sub(x1_[:, i].view(n, 1), x2_[:, i], out=scratch)
+            out.add_(scratch.pow_(2).div_(-2).exp_())
+    return out
 
 
 class GAMFunction(torch.autograd.Function):
@@ -18,16 +34,9 @@ class GAMFunction(torch.autograd.Function):
         x2_ = x2.div(lengthscale)  # +m x d vector
         ctx.save_for_backward(x1, x2, lengthscale)  # maybe have to change?
         kernel = torch.zeros(n, m, dtype=x1_.dtype, device=x1.device)  # use accumulator+loop instead of expansion
-        for i in range(d):
-            # does cdist still create a new n x m tensor in the graph? Any way to avoid allocating the memory?
-            # Should just create temporary n x m tensor and add it to the accumulator.
-            with torch.no_grad():
-                # kernel.add_(torch.cdist(x1_[:, i:i+1], x2_[:, i:i+1]).pow_(2).div_(-2).exp_())
-                # kernel.add_((x1_[:, i].expand(m, -1).t() - x2_[:,i].expand(n, -1)).pow_(2).div_(-2).exp_())
-                # The cdist implementation is dramatically slower! But the above is too data hungry somehow?
-                #   it must be due to the double 'expand's. The below is almost as fast and saves memory.
-                kernel.add_((x1_[:, i].view(n, 1) - x2_[:, i].expand(n, -1)).pow_(2).div_(-2).exp_())
-        return kernel
+        # cdist is dramatically slower than broadcasting one column against another, and expanding both sides
+        #   is too data hungry.
+        return _gam_accumulate(x1_, x2_, kernel)
 
     @staticmethod
     def backward(ctx, grad_output):
@@ -42,16 +51,18 @@ class GAMFunction(torch.autograd.Function):
         x2_grad = torch.zeros_like(x2) if x2.requires_grad else None
 
         # Again, use accumulators instead of expansion. Less computationally efficient, but more memory efficient.
+        # The n x m temporaries are allocated once and reused for every dimension.
+        diff, sq_dist, Delta_K = (torch.empty(n, m, dtype=x1.dtype, device=x1.device) for _ in range(3))
         with torch.no_grad():
             for i in range(d):
-                sq_dist = (x2_[:, i].expand(n,-1) - x1_[:, i].view(n, 1)).pow_(2)
-                # sq_dist = torch.cdist(x1_[:, i:i + 1], x2_[:, i:i + 1]).pow_(2)
-                Delta_K = sq_dist.div(-2).exp_().mul_(grad_output)  # Reused below.
+                torch.sub(x2_[:, i], x1_[:, i].view(n, 1), out=diff)
+                torch.mul(diff, diff, out=sq_dist)
+                torch.div(sq_dist, -2, out=Delta_K).exp_().mul_(grad_output)  # Reused below.
                 idx = i if num_l > 1 else 0
                 lengthscale_grad[...,idx].add_(sq_dist.mul_(Delta_K).sum().div(lengthscale[..., idx]))
 
                 if x1.requires_grad or x2.requires_grad:
-                    Delta_K_diff = (x2_[:, i].expand(n, -1) - x1_[:, i].view(n, 1)).mul_(Delta_K)
+                    Delta_K_diff = diff.mul_(Delta_K)
                     if x1.requires_grad:
                         x1_grad[:, i] = Delta_K_diff.sum(dim=1).div_(lengthscale[idx])  # sum over rows/x2s
                     if x2.requires_grad:
@@ -67,3 +78,36 @@ class MemoryEfficientGamKernel(gpytorch.kernels.Kernel):
 
     def forward(self, x1, x2, diag=False, last_dim_is_batch=False, **params):
         return self.covar_dist.apply(x1, x2, self.lengthscale)
+
+
+class KeOpsGamKernel(KeOpsKernel):
+    """KeOps version of MemoryEfficientGamKernel: the sum over dimensions of (shared lengthscale) RBF kernels.
+    The whole sum is a single symbolic KeOps formula, so neither the n x m kernel nor per-dimension
+    temporaries are ever materialized."""
+    def __init__(self, **kwargs):
+        self.has_lengthscale = True
+        super().__init__(has_lengthscale=True, **kwargs)
+
+    def covar_func(self, x1, x2, diag=False):
+        # Same KeOps size workaround as KeOpsInverseMQKernel.
+        if diag:
+            return (x1 - x2).pow(2).div(-2).exp().sum(-1)
+        elif x1.size(-2) == 1 or x2.size(-2) == 1:
+            return (x1.unsqueeze(-2) - x2.unsqueeze(-3)).pow(2).div(-2).exp().sum(-1)
+        else:
+            with torch.autograd.enable_grad():
+                x1_ = KEOLazyTensor(x1[..., :, None, :])
+                x2_ = KEOLazyTensor(x2[..., None, :, :])
+
+                K = (((x1_ - x2_) ** 2) * (-1/2)).exp().sum(-1)
+
+                return K
+
+    def forward(self, x1, x2, diag=False, **params):
+        x1_ = x1.div(self.lengthscale)
+        x2_ = x2.div(self.lengthscale)
+        if diag:
+            return self.covar_func(x1_, x2_, diag=True)
+
+        covar_func = lambda x1, x2, diag=False: self.covar_func(x1, x2, diag)
+        return KeOpsLazyTensor(x1_, x2_, covar_func)
@@ -1,6 +1,7 @@
 import copy
 
 import gpytorch
+import numpy as np
 import torch
 from torch import nn, __init__
 
@@ -217,8 +218,9 @@ class PolynomialProjectionKernel(GeneralizedPolynomialProjectionKernel):
         if activation is not None:
             raise ValueError("activation not supported through the normal projection interface. Use the GeneralPolynomialProjectionKernel instead.")
         projection_module = torch.nn.Linear(d, J*k, bias=False)
-        W = torch.nn.Parameter(torch.cat(Ws, dim=1).t())
-        b = torch.nn.Parameter(torch.cat(bs, dim=0))
+        # Ws/bs are either lists of the J per-projection d x k matrices/k vectors, or already concatenated.
+        W = torch.nn.Parameter((Ws if torch.is_tensor(Ws) else torch.cat(Ws, dim=1)).t())
+        b = torch.nn.Parameter(bs if torch.is_tensor(bs) else torch.cat(bs, dim=0))
         projection_module.weight = W
         projection_module.bias = b
         super(PolynomialProjectionKernel, self
@@ -229,29 +231,34 @@ class PolynomialProjectionKernel(GeneralizedPolynomialProjectionKernel):
 class RPPolyKernel(PolynomialProjectionKernel):
     def __init__(self, J, k, d, base_kernel, activation=None, learn_proj=False, weighted=False, space_proj=False,
                  ski=False, ski_options=None, X=None, **kernel_kwargs):
-        projs = [rp.gen_rp(d, k) for _ in range(J)]
-        bs = [torch.zeros(k) for _ in range(J)]
+        projs = rp.gen_rp_batch(d, k, J)  # d x J*k
+        bs = torch.zeros(J*k)
 
         if space_proj:
             # TODO: If k>1, could implement equal spacing for each set of projs
-            newW, _ = rp.space_equally(torch.cat(projs, dim=1).t(), lr=0.1, niter=5000)
+            newW, _ = rp.space_equally(projs.t(), lr=0.1, niter=5000)
             newW.requires_grad = False
-            projs = [newW[i:i + 1, :].t() for i in range(J)]
+            projs = newW.t()
         super(RPPolyKernel, self).__init__(J, k, d, base_kernel, projs, bs, activation=activation,
                                            learn_proj=learn_proj, weighted=weighted, ski=ski, ski_options=ski_options,
                                            X=X, **kernel_kwargs)
 
 
 class CustomAdditiveKernel(GeneralizedProjectionKernel):
-    """For convenience"""
+    """For convenience
+    groups is either a list of lists of dimensions, or an integer array with one group per row padded with -1."""
     def __init__(self, groups, d, base_kernel, weighted=False, ski=False, ski_options=None, X=None, **kernel_kwargs):
         class GroupFeaturesModule(nn.Module):
             def __init__(self, groups):
                 super(GroupFeaturesModule, self).__init__()
-                order = []
-                for g in groups:
-                    order.extend(g)
-                order = torch.tensor(order)
+                if isinstance(groups, np.ndarray):
+                    order = groups[groups >= 0]  # row major, so groups stay in order
+                else:
+                    order = []
+                    for g in groups:
+                        order.extend(g)
+                # A buffer, so the flat feature order moves with the module's .to(); no padded copy is needed.
+                order = torch.as_tensor(order, dtype=torch.long)
                 self.register_buffer('order', order)
 
             def forward(self, x):
@@ -265,10 +272,15 @@ class CustomAdditiveKernel(GeneralizedProjectionKernel):
                 return M
 
         projection_module = GroupFeaturesModule(groups)
-        degrees = [len(g) for g in groups]
+        if isinstance(groups, np.ndarray):
+            degrees = (groups >= 0).sum(axis=1).tolist()
+        else:
+            degrees = [len(g) for g in groups]
         super(CustomAdditiveKernel, self).__init__(degrees, d, base_kernel, projection_module,
                                                    weighted=weighted, ski=ski, ski_options=ski_options,
                                                    X=X, **kernel_kwargs)
+        if isinstance(groups, np.ndarray):
+            groups = [tuple(row[row >= 0].tolist()) for row in groups]  # strip the padding
         self.groups = groups
 
 
@@ -9,10 +9,19 @@ from math import sqrt, pi
 
 def gen_rp(d, k, dist='gaussian'):
     """Generate a random projection matrix (input dim d output dim k)"""
+    return gen_rp_batch(d, k, 1, dist=dist)
+
+
+def gen_rp_batch(d, k, J, dist='gaussian'):
+    """Generate J random projection matrices (input dim d output dim k) in a single draw.
+
+    Returns a d x J*k matrix whose column blocks of width k are each distributed like gen_rp(d, k, dist),
+    i.e. the same as concatenating J calls to gen_rp along dim 1.
+    """
     if dist == 'gaussian':
-        return torch.randn(d, k) / np.sqrt(k)
+        return torch.randn(d, J*k) / np.sqrt(k)
     elif dist == 'sphere':
-        W = torch.randn(d, k)
+        W = torch.randn(d, J*k)
         vecnorms = torch.norm(W, p=2, dim=0, keepdim=True)
         W = torch.div(W, vecnorms)
         # variance of w drawn uniformly from unit sphere is
@@ -20,18 +29,40 @@ def gen_rp(d, k, dist='gaussian'):
         return W * sqrt(d) / sqrt(k)
     elif dist == 'very-sparse':
         categorical = Categorical(torch.tensor([1/(2 * sqrt(d)), 1-1/sqrt(d), 1/(2*sqrt(d))]))
-        samples = categorical.sample(torch.Size([d, k])) - 1
+        samples = categorical.sample(torch.Size([d, J*k])) - 1
         samples = samples.to(dtype=torch.float)
         return samples
     elif dist == 'bernoulli':
-        return (torch.bernoulli(torch.rand(d, k)) * 2 - 1) / sqrt(k)
+        return (torch.bernoulli(torch.rand(d, J*k)) * 2 - 1) / sqrt(k)
     elif dist == 'uniform':
         # variance of uniform on -1, 1 is 1 / 3
-        return (torch.rand(d, k) * 2 - 1) / sqrt(k) * sqrt(3)
+        return (torch.rand(d, J*k) * 2 - 1) / sqrt(k) * sqrt(3)
+    elif dist == 'sparse_sign':
+        rows, cols, values = gen_sparse_sign(d, k, J)
+        W = torch.zeros(d, J*k)
+        W[rows, cols] = values
+        return W
     else:
         raise ValueError("Not a valid RP distribution")
 
 
+def gen_sparse_sign(d, k, J=1, s=None):
+    """Generate J sparse sign random projections (input dim d output dim k) in compact (COO) form.
+
+    Each of the J*k output columns has s nonzero entries (default ceil(sqrt(d))) in distinct random rows,
+    with random signs and magnitude sqrt(d / (s k)) so entries have the same variance as gen_rp's.
+    :return: rows, cols, values of the nonzero entries of the d x J*k projection matrix
+    """
+    if s is None:
+        s = int(np.ceil(sqrt(d)))
+    s = min(s, d)
+    weights = torch.ones(d)  # draw distinct rows column by column, without a dense J*k x d buffer
+    rows = torch.cat([torch.multinomial(weights, s) for _ in range(J*k)])
+    cols = torch.arange(J*k).repeat_interleave(s)
+    values = (torch.bernoulli(torch.full((J*k*s,), 0.5)) * 2 - 1) * sqrt(d / (s * k))
+    return rows, cols, values
+
+
 def gen_pca_rp(d, k, W, D):
     """
     :param d: dimension of data
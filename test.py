@@ -2,10 +2,12 @@ from unittest import TestCase
 from gp_models import PolynomialProjectionKernel, ExactGPModel, GeneralizedPolynomialProjectionKernel, \
     StrictlyAdditiveKernel
 from gp_models import CustomAdditiveKernel, convert_rp_model_to_additive_model
-from gp_models import ScaledProjectionKernel, MemoryEfficientGamKernel, GAMFunction
+from gp_models import ScaledProjectionKernel, MemoryEfficientGamKernel, GAMFunction, SparseSignProjection, \
+    KeOpsGamKernel
 from gp_models.models import AdditiveExactGPModel, ProjectedAdditiveExactGPModel
-from rp import gen_rp, space_equally
+from rp import gen_rp, gen_rp_batch, gen_sparse_sign, space_equally
 from gp_experiment_runner import load_dataset, _normalize_by_train, _access_fold, _determine_folds
+from training_routines import create_exact_gp, _can_reset, _reset_hyperparameters
 import torch
 import torch.nn.functional as F
 import gpytorch
@@ -108,6 +110,18 @@ class TestRPGenerator(TestCase):
         dists = pairwise_distance(proj, proj)
         self.assertLess((real_dists - dists).abs().mean() / fake_dists.abs().mean(), 0.1)  # no strict guarantee...
 
+    def test_gen_batch(self):
+        W = gen_rp_batch(100, 4, 250, dist='bernoulli')
+        self.assertEqual(W.shape, torch.Size([100, 1000]))
+        # Each block is scaled for its own output dim k, not for J*k.
+        self.assertTrue(torch.allclose(W.abs(), torch.full_like(W, 0.5)))
+
+    def test_sparse_sign(self):
+        proj = SparseSignProjection(100, 20, *gen_sparse_sign(100, 4, 5))
+        W = proj.weight
+        self.assertTrue(((W != 0).sum(dim=1) == 10).all())  # ceil(sqrt(d)) nonzeros per output
+        self.assertTrue(torch.allclose(proj(fake_data), fake_data.matmul(W.t()), atol=1e-4))
+
 
 class TestPolyProjectionKernel(TestCase):
     def setUp(self):
@@ -356,6 +370,14 @@ class TestAdditiveKernel(TestCase):
         k2 = kernel2(x).evaluate()
         self.assertNotAlmostEqual(k[0, 1].item(), k2[0,1].item())
 
+    def test_padded_groups(self):
+        kernel = CustomAdditiveKernel([[1, 2], [0]], 4, gpytorch.kernels.RBFKernel)
+        kernel2 = CustomAdditiveKernel(np.array([[1, 2], [0, -1]]), 4, gpytorch.kernels.RBFKernel)
+        self.assertListEqual(kernel2.groups, [(1, 2), (0,)])
+        self.assertTrue(torch.equal(kernel.projection_module.order, kernel2.projection_module.order))
+        x = torch.rand(5, 4)
+        np.testing.assert_allclose(kernel(x).evaluate().detach().numpy(), kernel2(x).evaluate().detach().numpy())
+
     def test_convert_from_projection_kernel(self):
         Ws = [torch.eye(2, 2) for _ in range(3)]
         bs = [torch.zeros(2) for _ in range(3)]
@@ -529,6 +551,42 @@ class TestExperimentHelpers(TestCase):
         self.assertListEqual(train['index'].values.tolist(), [0, 1, 3])
 
 
+class TestResetHyperparameters(TestCase):
+    def check_reset(self, proj_dist):
+        model_kwargs = dict(J=3, proj_dist=proj_dist, noise_prior=False,
+                            init_lengthscale_range=(0.5, 2.), init_noise_range=(0.1, 0.5))
+        model, _ = create_exact_gp(fake_data[:20, :10], fake_target[:20], 'additive_rp', **model_kwargs)
+        self.assertTrue(_can_reset('additive_rp', model_kwargs, model))
+        initial_state = {k: v.clone() for k, v in model.state_dict().items()}
+        proj_kernel = model.covar_module.base_kernel
+        initial_W = proj_kernel.projection_module.weight.clone()
+        with torch.no_grad():  # as if trained
+            for param in model.parameters():
+                param.add_(1.)
+
+        _reset_hyperparameters(model, initial_state, model_kwargs)
+        self.assertFalse(torch.equal(proj_kernel.projection_module.weight, initial_W))
+        ls = proj_kernel.lengthscale
+        self.assertTrue(((ls > 0.5 - 1e-5) & (ls < 2. + 1e-5)).all())
+        noise = model.likelihood.noise
+        self.assertTrue(((noise > 0.1 - 1e-5) & (noise < 0.5 + 1e-5)).all())
+        redrawn = ('covar_module.base_kernel.projection_module.', 'covar_module.base_kernel.raw_lengthscale',
+                   'likelihood.noise_covar.raw_noise')
+        for name, value in model.state_dict().items():
+            if not name.startswith(redrawn):
+                self.assertTrue(torch.equal(value, initial_state[name]), name)
+
+    def test_reset_dense(self):
+        self.check_reset('gaussian')
+
+    def test_reset_sparse_sign(self):
+        self.check_reset('sparse_sign')
+
+    def test_cant_reset(self):
+        model, _ = create_exact_gp(fake_data[:20, :10], fake_target[:20], 'full', noise_prior=False)
+        self.assertFalse(_can_reset('full', {}, model))
+
+
 class TestManualRescaleKernel(TestCase):
     def test_prescale(self):
         x = torch.tensor([[1., 2., 3.], [1.1, 2.2, 3.3]])
@@ -634,6 +692,12 @@ class TestMemEffGamKernel(TestCase):
 
         np.testing.assert_allclose(K.detach().numpy(), K2.detach().numpy(), atol=1e-6)
 
+    def test_keops_forward(self):
+        x = torch.rand(50, 3)
+        K = KeOpsGamKernel()(x, x).evaluate()
+        K2 = MemoryEfficientGamKernel()(x, x).evaluate()
+        np.testing.assert_allclose(K.detach().numpy(), K2.detach().numpy(), atol=1e-5)
+
 
 class TestGAMFunction(TestCase):
     # Doubles for accurate numerical gradient
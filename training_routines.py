@@ -1,9 +1,10 @@
 import math
 import rp
 from gp_models.models import ExactGPModel
-from gp_models.kernels.etc import DNN
+from gp_models.kernels.etc import DNN, SparseSignProjection
 from gp_models.kernels import PolynomialProjectionKernel, GeneralizedProjectionKernel, GeneralizedPolynomialProjectionKernel
 from gp_models.kernels import ScaledProjectionKernel, InverseMQKernel, MemoryEfficientGamKernel, KeOpsInverseMQKernel
+from gp_models.kernels import KeOpsGamKernel
 from gpytorch.kernels import ScaleKernel, RBFKernel, GridInterpolationKernel, MaternKernel, InducingPointKernel
 from gpytorch.kernels import MultiDeviceKernel
 from gpytorch.kernels import NewtonGirardAdditiveKernel
@@ -15,10 +16,13 @@ import torch
 import warnings
 import copy
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from config import data_base_path, model_base_path
 import numpy as np
 from itertools import combinations
 from fitting.optimizing import train_to_convergence, mean_squared_error, learn_projections
+from utils import _atomic_torch_save
 
 
 def _map_to_optim(optimizer):
@@ -34,56 +38,103 @@ def _map_to_optim(optimizer):
     return optimizer_
 
 
+# Saving state dicts happens in the background so that training routines don't wait on disk I/O.
+_save_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def _report_save_error(future):
+    if future.exception() is not None:
+        warnings.warn("Failed to save state dict: {}".format(future.exception()))
+
+
 def _save_state_dict(model):
-    """Helper to save the state dict of a torch model to a unique filename"""
-    d = model.state_dict()
-    s = str(d)
-    h = hash(s)
-    fname = 'model_state_dict_{}.pkl'.format(h)
-    torch.save(d, os.path.join(model_base_path, 'models', fname))
+    """Helper to save the state dict of a torch model to a unique filename.
+    The file is written on a background thread; the filename is returned immediately."""
+    # Copy to the CPU on this thread so the saved tensors can't change (or be freed) on the device in the meantime.
+    d = {key: value.detach().to('cpu', copy=True) for key, value in model.state_dict().items()}
+    # Hash the raw tensor bytes rather than hash(str(d)), which formats every value and is randomized per process.
+    h = hashlib.blake2b(digest_size=8)
+    for key in sorted(d):
+        h.update(key.encode())
+        h.update(d[key].contiguous().numpy().tobytes())
+    fname = 'model_state_dict_{}.pkl'.format(h.hexdigest())
+    future = _save_executor.submit(torch.save, d, os.path.join(model_base_path, 'models', fname))
+    future.add_done_callback(_report_save_error)
     return fname
 
 
+def _to_device(tensors, device, dtype=None):
+    """Move tensors to the device (and dtype), asynchronously for pinned host memory.
+    Tensors already on the device with the right dtype are returned as is (Tensor.to doesn't copy them)."""
+    return tuple(t.to(device=device, dtype=dtype, non_blocking=t.is_pinned()) for t in tensors)
+
+
 def _sample_from_range(num_samples, range_):
+    if range_[0] == range_[1]:  # e.g. the default (1., 1.); no need to draw anything
+        return torch.full((num_samples,), float(range_[0]))
     return torch.rand(num_samples) * (range_[1] - range_[0]) + range_[0]
 
 
-def _map_to_kernel(return_object, kernel_type, keops, **key_words):
-    # TODO: have MemoryEfficientGAM kernel in here.
-    if return_object:
-        cls, kwargs = _map_to_kernel(False, kernel_type, keops)
-        return cls(**key_words, **kwargs)
+def _can_reset(kind, model_kwargs, model):
+    """Whether _reset_hyperparameters supports a model built by create_exact_gp; otherwise it has to be rebuilt."""
+    return (kind == 'additive_rp' and not model_kwargs.get('space_proj', False)
+            and not isinstance(model.covar_module, MultiDeviceKernel))
+
+
+def _reset_hyperparameters(model, initial_state, model_kwargs):
+    """Re-randomize a model built by create_exact_gp in place for another random restart (see _can_reset).
+    Restores initial_state and redraws the random projection, lengthscales and noise as create_exact_gp would."""
+    model.load_state_dict(initial_state)
+    proj_kernel = model.covar_module.base_kernel
+    proj_module = proj_kernel.projection_module
+    k = model_kwargs.get('k', 1)
+    if isinstance(proj_module, SparseSignProjection):
+        for buf, new in zip((proj_module.rows, proj_module.cols, proj_module.values),
+                            rp.gen_sparse_sign(proj_module.in_features, k, proj_module.out_features // k)):
+            buf.copy_(new)
     else:
-        if kernel_type == 'RBF':
-            if not keops:
-                cls = gpytorch.kernels.RBFKernel
-                kwargs = dict(**key_words)
-            else:
-                cls = gpytorch.kernels.keops.RBFKernel
-                kwargs = dict(**key_words)
-        elif kernel_type == 'Matern':
-            if not keops:
-                cls = gpytorch.kernels.MaternKernel
-                kwargs = dict(nu=1.5, **key_words)
-            else:
-                cls = gpytorch.kernels.keops.MaternKernel
-                kwargs = dict(nu=1.5, **key_words)
-        elif kernel_type == 'InverseMQ':
-            if not keops:
-                cls = InverseMQKernel
-                kwargs = dict(**key_words)
-            else:
-                cls = KeOpsInverseMQKernel
-                kwargs = dict(**key_words)
-        elif kernel_type == 'Cosine':
-            if not keops:
-                cls = gpytorch.kernels.CosineKernel
-                kwargs = dict(**key_words)
-            else:
-                raise ValueError("Cosine kernel not implemented yet with KeOps")
-        else:
-            raise ValueError("Unknown kernel type")
-        return cls, kwargs
+        out_dim, d = proj_module.weight.shape
+        W = rp.gen_rp_batch(d, k, out_dim // k, dist=model_kwargs.get('proj_dist', 'gaussian'))
+        proj_module.weight.data.copy_(W.t())
+    num_ls = proj_kernel.lengthscale.shape[-1]
+    proj_kernel.initialize(lengthscale=_sample_from_range(num_ls, model_kwargs.get('init_lengthscale_range', (1., 1.))))
+    model.likelihood.noise = _sample_from_range(1, model_kwargs.get('init_noise_range', [1.0, 1.0]))
+
+
+def _clear_projection_caches(model):
+    """Drop projections cached by a model's projection kernels, e.g. after loading different projection weights"""
+    for module in model.modules():
+        if isinstance(module, GeneralizedProjectionKernel):
+            module.last_x1 = None
+            module.cached_projections = None
+
+
+# kernel type: (class, KeOps class or None if not supported, default keyword arguments)
+# TODO: have MemoryEfficientGAM kernel in here.
+_KERNEL_TABLE = {
+    'RBF': (gpytorch.kernels.RBFKernel, gpytorch.kernels.keops.RBFKernel, dict()),
+    'Matern': (gpytorch.kernels.MaternKernel, gpytorch.kernels.keops.MaternKernel, dict(nu=1.5)),
+    'InverseMQ': (InverseMQKernel, KeOpsInverseMQKernel, dict()),
+    'Cosine': (gpytorch.kernels.CosineKernel, None, dict()),
+}
+
+
+def _kernel_cls(kernel_type, keops, **key_words):
+    """Helper to map kernel type names to a kernel class and the keyword arguments to construct it with"""
+    if kernel_type not in _KERNEL_TABLE:
+        raise ValueError("Unknown kernel type")
+    cls, keops_cls, kwargs = _KERNEL_TABLE[kernel_type]
+    if keops:
+        if keops_cls is None:
+            raise ValueError("{} kernel not implemented yet with KeOps".format(kernel_type))
+        cls = keops_cls
+    return cls, dict(kwargs, **key_words)
+
+
+def _make_kernel(kernel_type, keops, **key_words):
+    """Helper to construct a kernel object of the given type"""
+    cls, kwargs = _kernel_cls(kernel_type, keops, **key_words)
+    return cls(**kwargs)
 
 
 def create_deep_rp_poly_kernel(d, degrees, projection_architecture, projection_kwargs, learn_proj=False,
@@ -96,7 +147,7 @@ def create_deep_rp_poly_kernel(d, degrees, projection_architecture, projection_k
     else:
         raise NotImplementedError("No architecture besides DNN is implemented ATM")
 
-    kernel, kwargs = _map_to_kernel(False, kernel_type, keops)
+    kernel, kwargs = _kernel_cls(kernel_type, keops)
 
     kernel = GeneralizedProjectionKernel(degrees, d, kernel, module,
                                                  learn_proj=learn_proj,
@@ -105,22 +156,45 @@ def create_deep_rp_poly_kernel(d, degrees, projection_architecture, projection_k
     return kernel
 
 
+_spaced_projection_cache = dict()
+
+
+def _spaced_projections(d, k, J, proj_dist, cache=False):
+    """Draw J*k random projections and space them equally (rp.space_equally), returned as a J*k x d matrix.
+    The result only depends on (d, k, J, proj_dist), so with cache=True it is computed once and reused, in memory
+    and across processes via <model_base_path>/spaced_projs_cache/. Otherwise fresh projections are drawn every time."""
+    if not cache:
+        # TODO: If k>1, could implement equal spacing for each set of projs
+        W, _ = rp.space_equally(rp.gen_rp_batch(d, k, J, dist=proj_dist).t(), lr=0.1, niter=5000)
+        # W = rp.compute_spherical_t_design(num_dims-1, t=4, N=J)
+        W.requires_grad = False
+        return W
+
+    key = (d, k, J, proj_dist)
+    if key not in _spaced_projection_cache:
+        path = os.path.join(model_base_path, 'spaced_projs_cache', 'spaced_projs_{}_{}_{}_{}.pt'.format(*key))
+        if os.path.exists(path):
+            W = torch.load(path)
+        else:
+            W = _spaced_projections(d, k, J, proj_dist)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_torch_save(W, path)
+        _spaced_projection_cache[key] = W
+    return _spaced_projection_cache[key].clone()  # callers may go on to learn the projections
+
+
 def create_rp_poly_kernel(d, k, J, activation=None,
                           learn_proj=False, weighted=False, kernel_type='RBF',
                           space_proj=False, init_mixin_range=(1.0, 1.0), init_lengthscale_range=(1.0, 1.0),
-                          ski=False, ski_options=None, X=None, proj_dist='gaussian', keops=False
-                          ):
-    projs = [rp.gen_rp(d, k, dist=proj_dist) for _ in range(J)]
-    bs = [torch.zeros(k) for _ in range(J)]
-
+                          ski=False, ski_options=None, X=None, proj_dist='gaussian', keops=False,
+                          cache_spaced_proj=False):
     if space_proj:
-        # TODO: If k>1, could implement equal spacing for each set of projs
-        newW, _ = rp.space_equally(torch.cat(projs,dim=1).t(), lr=0.1, niter=5000)
-        # newW = rp.compute_spherical_t_design(num_dims-1, t=4, N=J)
-        newW.requires_grad = False
-        projs = [newW[i:i+1, :].t() for i in range (J)]
+        projs = _spaced_projections(d, k, J, proj_dist, cache=cache_spaced_proj).t()  # d x J*k
+    else:
+        projs = rp.gen_rp_batch(d, k, J, dist=proj_dist)  # d x J*k
+    bs = torch.zeros(J*k)
 
-    kernel, kwargs = _map_to_kernel(False, kernel_type, keops)
+    kernel, kwargs = _kernel_cls(kernel_type, keops)
 
     kernel = PolynomialProjectionKernel(J, k, d, kernel, projs, bs, activation=activation, learn_proj=learn_proj,
                                         weighted=weighted, ski=ski, ski_options=ski_options, X=X, **kwargs)
@@ -130,23 +204,28 @@ def create_rp_poly_kernel(d, k, J, activation=None,
 
 def create_additive_rp_kernel(d, J, learn_proj=False, kernel_type='RBF', space_proj=False, prescale=False, ard=True,
                               init_lengthscale_range=(1., 1.), ski=False, ski_options=None, proj_dist='gaussian',
-                              batch_kernel=True, mem_efficient=False, k=1, keops=False):
+                              batch_kernel=True, mem_efficient=False, k=1, keops=False, cache_spaced_proj=False):
     if k > 1 and (mem_efficient or batch_kernel or space_proj):
         raise ValueError("Can't have k > 1 with memory efficient GAM kernel or a batch kernel or spaced projections.")
 
-    projs = [rp.gen_rp(d, k, dist=proj_dist) for _ in range(J)]
-    # bs = [torch.zeros(1) for _ in range(J)]
-    if space_proj:
-        newW, _ = rp.space_equally(torch.cat(projs,dim=1).t(), lr=0.1, niter=5000)
-        # newW = rp.compute_spherical_t_design(num_dims-1, N=J)
-        newW.requires_grad = False
-        projs = [newW[i:i+k, :].t() for i in range(0, J*k, k)]
-    proj_module = torch.nn.Linear(d, J*k, bias=False)
-    proj_module.weight.data = torch.cat(projs, dim=1).t()
+    if proj_dist == 'sparse_sign':
+        if learn_proj or space_proj:
+            raise ValueError("Sparse sign projections can't be learned or spaced.")
+        # Only the nonzeros are stored and the projection is applied without a dense matmul.
+        proj_module = SparseSignProjection(d, J*k, *rp.gen_sparse_sign(d, k, J))
+    else:
+        # J*k x d, the layout of the Linear weight
+        if space_proj:
+            W = _spaced_projections(d, k, J, proj_dist, cache=cache_spaced_proj)
+        else:
+            W = rp.gen_rp_batch(d, k, J, dist=proj_dist).t()
+        # bs = [torch.zeros(1) for _ in range(J)]
+        proj_module = torch.nn.Linear(d, J*k, bias=False)
+        proj_module.weight.data = W
     # proj_module.bias.data = torch.cat(bs, dim=0)
 
     def make_kernel(active_dim=None):
-        kernel = _map_to_kernel(True, kernel_type, keops, active_dims=active_dim)
+        kernel = _make_kernel(kernel_type, keops, active_dims=active_dim)
 
         if hasattr(kernel, 'period_length'):
             kernel.initialize(period_length=torch.tensor([1.]))
@@ -165,7 +244,7 @@ def create_additive_rp_kernel(d, J, learn_proj=False, kernel_type='RBF', space_p
             raise ValueError("Impossible to have batch kernel and memory efficient GAM")
         if kernel_type != 'RBF':
             raise ValueError("Memory efficient GAM with alternative sub-kernels not implemented yet.")
-        add_kernel = MemoryEfficientGamKernel()
+        add_kernel = KeOpsGamKernel() if keops else MemoryEfficientGamKernel()
     elif batch_kernel:
         kernel = make_kernel(None)
         add_kernel = gpytorch.kernels.AdditiveStructureKernel(kernel, J)
@@ -193,13 +272,13 @@ def create_general_rp_poly_kernel(d, degrees, learn_proj=False, weighted=False,
                                   init_lengthscale_range=(1.0, 1.0), init_mixin_range=(1.0, 1.0),
                                   ski=False, ski_options=None, X=None, keops=False):
     out_dim = sum(degrees)
-    W = torch.cat([rp.gen_rp(d, 1) for _ in range(out_dim)], dim=1).t()
+    W = rp.gen_rp_batch(d, 1, out_dim).t()
     b = torch.zeros(out_dim)
     projection_module = torch.nn.Linear(d, out_dim, bias=False)
     projection_module.weight = torch.nn.Parameter(W)
     projection_module.bias = torch.nn.Parameter(b)
 
-    kernel, kwargs = _map_to_kernel(False, kernel_type, keops)
+    kernel, kwargs = _kernel_cls(kernel_type, keops)
 
     kernel = GeneralizedProjectionKernel(degrees, d, kernel, projection_module, learn_proj, weighted, ski, ski_options,
                                          X=X, **kwargs)
@@ -218,7 +297,7 @@ def create_strictly_additive_kernel(d, weighted=False, kernel_type='RBF', init_l
         kernel.initialize(lengthscale=_sample_from_range(d, init_lengthscale_range))
         return kernel
     else:
-        kernel, kwargs = _map_to_kernel(False, kernel_type, keops)
+        kernel, kwargs = _kernel_cls(kernel_type, keops)
 
     kernel = StrictlyAdditiveKernel(d, kernel, weighted, ski=ski, ski_options=ski_options, X=X, **kwargs)
     kernel.initialize(init_mixin_range, init_lengthscale_range)
@@ -227,7 +306,7 @@ def create_strictly_additive_kernel(d, weighted=False, kernel_type='RBF', init_l
 
 def create_additive_kernel(d, groups, weighted=False, kernel_type='RBF', init_lengthscale_range=(1.0, 1.0),
                            init_mixin_range=(1.0, 1.0), ski=False, ski_options=None, X=None, keops=False):
-    kernel, kwargs = _map_to_kernel(False, kernel_type, keops)
+    kernel, kwargs = _kernel_cls(kernel_type, keops)
 
     kernel = CustomAdditiveKernel(groups, d, kernel, weighted=weighted, ski=ski, ski_options=ski_options, X=X, **kwargs)
     kernel.initialize(init_mixin_range, init_lengthscale_range)
@@ -246,12 +325,15 @@ def create_duvenaud_additive_kernel(d, max_degree):
 
 def create_multi_additive_kernel(d, max_degree, weighted=False, kernel_type='RBF', init_lengthscale_range=(1.0, 1.0),
                                  init_mixin_range=(1.0, 1.0), ski=False, ski_options=False, X=None, keops=False):
-    kernel, kwargs = _map_to_kernel(False, kernel_type, keops)
+    kernel, kwargs = _kernel_cls(kernel_type, keops)
 
     max_degree = min(max_degree, d)
+    # combinations are already unique, so collect them straight into one array of groups padded with -1.
     groups = []
     for deg in range(1, max_degree+1):
-        groups.extend(list(set(combinations(list(range(d)), deg))))
+        combos = np.array(list(combinations(range(d), deg)), dtype=np.int64).reshape(-1, deg)
+        groups.append(np.pad(combos, ((0, 0), (0, max_degree - deg)), mode='constant', constant_values=-1))
+    groups = np.concatenate(groups)
 
     kernel = CustomAdditiveKernel(groups, d, kernel, weighted=weighted, ski=ski, ski_options=ski_options, X=X, **kwargs)
     kernel.initialize(init_mixin_range, init_lengthscale_range)
@@ -261,14 +343,20 @@ def create_multi_additive_kernel(d, max_degree, weighted=False, kernel_type='RBF
 def create_multi_full_kernel(d, J, init_mixin_range=(1.0, 1.0), **kwargs):
     """Helper to create a sum of full kernels with the options in **kwargs."""
     outputscales = _sample_from_range(J, init_mixin_range)
-    total = sum(outputscales)
-    outputscales = [o / total for o in outputscales]
-
-    subkernels = []
-    for j in range(0,J):
-        new_kernel = ScaleKernel(create_full_kernel(d, **kwargs))
+    outputscales = outputscales / outputscales.sum()
+
+    # The subkernels are all the same shape, so build one and copy it rather than constructing each from scratch.
+    # Copies get their own lengthscales, drawn like create_full_kernel does.
+    template = ScaleKernel(create_full_kernel(d, **kwargs))
+    subkernels = [template] + [copy.deepcopy(template) for _ in range(1, J)]
+    for j, new_kernel in enumerate(subkernels):
+        if j > 0:
+            base_kernel = new_kernel.base_kernel
+            if isinstance(base_kernel, GridInterpolationKernel):
+                base_kernel = base_kernel.base_kernel
+            base_kernel.initialize(lengthscale=_sample_from_range(base_kernel.lengthscale.numel(),
+                                                                  kwargs.get('init_lengthscale_range', (1.0, 1.0))))
         new_kernel.initialize(outputscale=outputscales[j])
-        subkernels.append(new_kernel)
     return gpytorch.kernels.AdditiveKernel(*subkernels)
 
 
@@ -280,7 +368,7 @@ def create_full_kernel(d, ard=False, ski=False, grid_size=None, kernel_type='RBF
     else:
         ard_num_dims = None
 
-    kernel = _map_to_kernel(True, kernel_type, keops, ard_num_dims=ard_num_dims)
+    kernel = _make_kernel(kernel_type, keops, ard_num_dims=ard_num_dims)
 
     if ard:
         samples = ard_num_dims
@@ -412,14 +500,11 @@ def create_exact_gp(trainX, trainY, kind, devices=('cpu',), **kwargs):
 
 def train_ppr_gp(trainX, trainY, testX, testY, model_kwargs, train_kwargs, device='cpu',
                  skip_posterior_variances=False):
-    model_kwargs = copy.copy(model_kwargs)
-    train_kwargs = copy.copy(train_kwargs)
+    model_kwargs = dict(model_kwargs)
+    train_kwargs = dict(train_kwargs)
     d = trainX.shape[-1]
     device = torch.device(device)
-    trainX = trainX.to(device)
-    trainY = trainY.to(device)
-    testX = testX.to(device)
-    testY = testY.to(device)
+    trainX, trainY, testX, testY = _to_device((trainX, trainY, testX, testY), device)
 
     kernel_type = model_kwargs.pop('kernel_type', 'RBF')
     if kernel_type == 'RBF':
@@ -470,8 +555,8 @@ def train_exact_gp(trainX, trainY, testX, testY, kind, model_kwargs, train_kwarg
                    skip_posterior_variances=False, skip_random_restart=False, evaluate_on_train=True,
                    output_device=None, record_pred_unc=False, double=False):
     """Create and train an exact GP with the given options"""
-    model_kwargs = copy.copy(model_kwargs)
-    train_kwargs = copy.copy(train_kwargs)
+    model_kwargs = dict(model_kwargs)
+    train_kwargs = dict(train_kwargs)
     d = trainX.shape[-1]
     devices = [torch.device(device) for device in devices]
     if output_device is None:
@@ -480,10 +565,7 @@ def train_exact_gp(trainX, trainY, testX, testY, kind, model_kwargs, train_kwarg
         output_device = torch.device(output_device)
     type_ = torch.double if double else torch.float
 
-    trainX = trainX.to(output_device, type_)
-    trainY = trainY.to(output_device, type_)
-    testX = testX.to(output_device, type_)
-    testY = testY.to(output_device, type_)
+    trainX, trainY, testX, testY = _to_device((trainX, trainY, testX, testY), output_device, type_)
 
     # replace with value from dataset for convenience
     for k, v in list(model_kwargs.items()):
@@ -496,7 +578,7 @@ def train_exact_gp(trainX, trainY, testX, testY, kind, model_kwargs, train_kwarg
     optimizer_ = _map_to_optim(train_kwargs.pop('optimizer'))
     rr_check_conv = train_kwargs.pop('rr_check_conv', False)
 
-    initial_train_kwargs = copy.copy(train_kwargs)
+    initial_train_kwargs = dict(train_kwargs)
     initial_train_kwargs['max_iter'] = init_iters
     initial_train_kwargs['check_conv'] = rr_check_conv
     # initial_train_kwargs['verbose'] = 0  # don't shout about it
@@ -506,26 +588,49 @@ def train_exact_gp(trainX, trainY, testX, testY, kind, model_kwargs, train_kwarg
     # TODO: move random restarts code to a train_to_convergence-like function
     if not skip_random_restart:
         # Do some number of random restarts, keeping the best one after a truncated training.
+        # Where possible, one model is built and re-randomized in place for each restart instead of rebuilt.
+        # Otherwise only a CPU copy of the best restart's state is kept, rather than the live model, and is loaded
+        # into the last model afterwards. SKI grids are fit to each model's own projections though, so with SKI
+        # the best model itself is kept.
+        keep_best_model = model_kwargs.get('ski', False)
+        # No KeOps warm-up is needed here: pykeops caches each compiled formula (on disk, keyed by formula, dtype
+        # and device), so only the first restart pays for compilation and later restarts/models reuse it.
+        model = None
+        initial_state = None
         for restart in range(random_restarts):
             # TODO: log somehow what's happening in the restarts.
-            model, likelihood = create_exact_gp(trainX, trainY, kind, devices=devices, **model_kwargs)
-            model = model.to(output_device, type_)
+            if initial_state is not None:
+                _reset_hyperparameters(model, initial_state, model_kwargs)
+            else:
+                model, likelihood = create_exact_gp(trainX, trainY, kind, devices=devices, **model_kwargs)
+                model = model.to(output_device, type_)
+                if _can_reset(kind, model_kwargs, model):
+                    initial_state = {k: v.clone() for k, v in model.state_dict().items()}
 
-            # regular marginal log likelihood
-            mll = gpytorch.mlls.ExactMarginalLogLikelihood(likelihood, model)
+                # regular marginal log likelihood
+                mll = gpytorch.mlls.ExactMarginalLogLikelihood(likelihood, model)
             _ = train_to_convergence(model, trainX, trainY, optimizer=optimizer_,
                                      objective=mll, isloss=False, **initial_train_kwargs)
             model.train()
-            output = model(trainX)
-            loss = -mll(output, trainY).item()
+            # Only the value is needed, so don't build a graph. Syncing for it is free here since
+            # train_to_convergence already reads every step's loss back to the host.
+            with torch.no_grad():
+                output = model(trainX)
+                loss = -mll(output, trainY).item()
             if loss < best_loss:
                 best_loss = loss
-                best_model = model
-                best_likelihood = likelihood
-                best_mll = mll
-        model = best_model
-        likelihood = best_likelihood
-        mll = best_mll
+                if keep_best_model:
+                    best_model = model
+                    best_likelihood = likelihood
+                    best_mll = mll
+                best_state = {k: v.detach().to('cpu', copy=True) for k, v in model.state_dict().items()}
+        if keep_best_model and best_model is not model:
+            model = best_model
+            likelihood = best_likelihood
+            mll = best_mll
+        else:
+            model.load_state_dict(best_state)
+            _clear_projection_caches(model)
     else:
         model, likelihood = create_exact_gp(trainX, trainY, kind, devices=devices, **model_kwargs)
         model = model.to(output_device, type_)
@@ -571,7 +676,7 @@ def train_exact_gp(trainX, trainY, testX, testY, kind, model_kwargs, train_kwarg
                 model_metrics['test_nll'] = -mll(test_outputs, testY).item()
                 distro = likelihood(test_outputs)
                 lower, upper = distro.confidence_region()
-                frac = ((testY > lower) * (testY < upper)).to(torch.float).mean().item()
+                frac = torch.logical_and(testY > lower, testY < upper).to(torch.float).mean().item()
                 model_metrics['test_pred_frac_in_cr'] = frac
                 if record_pred_unc:
                     model_metrics['test_pred_z_score'] = (testY - distro.mean) / distro.stddev
@@ -600,10 +705,7 @@ def train_compressed_gp(trainX, trainY, testX, testY, model_kwargs, train_kwargs
         output_device = devices[0]
     else:
         output_device = torch.device(output_device)
-    trainX = trainX.to(output_device)
-    trainY = trainY.to(output_device)
-    testX = testX.to(output_device)
-    testY = testY.to(output_device)
+    trainX, trainY, testX, testY = _to_device((trainX, trainY, testX, testY), output_device)
 
     # Pack all of the kwargs into one object... maybe not the best idea.
     model = CGPSampler(trainX, trainY, **model_kwargs, **train_kwargs)
@@ -632,8 +734,8 @@ def train_exact_gp_model_average(trainX, trainY, testX, testY, kind, model_kwarg
                                  devices=('cpu',), skip_posterior_variances=False, evaluate_on_train=True,
                                  output_device=None, record_pred_unc=False):
     from fitting.sampling import ModelAverage
-    model_kwargs = copy.deepcopy(model_kwargs)
-    train_kwargs = copy.deepcopy(train_kwargs)
+    model_kwargs = dict(model_kwargs)
+    train_kwargs = dict(train_kwargs)
 
     if len(devices) > 1:
         raise ValueError("CGP not implemented for multi GPUs (yet?)")
@@ -644,10 +746,7 @@ def train_exact_gp_model_average(trainX, trainY, testX, testY, kind, model_kwarg
         output_device = devices[0]
     else:
         output_device = torch.device(output_device)
-    trainX = trainX.to(output_device)
-    trainY = trainY.to(output_device)
-    testX = testX.to(output_device)
-    testY = testY.to(output_device)
+    trainX, trainY, testX, testY = _to_device((trainX, trainY, testX, testY), output_device)
 
     predictions, log_mlls = [], []
     varying_params = model_kwargs.pop('varying_params')
@@ -660,8 +759,17 @@ def train_exact_gp_model_average(trainX, trainY, testX, testY, kind, model_kwarg
                        evaluate_on_train=False)
         log_mlls.append(-metrics['prior_train_nmll'])
         model.eval()
-        predictions.append(model(testX))
+        # Keep only a CPU copy of each prediction so that just one model is resident on the device at a time.
+        # Only the marginal variances are kept: a dense n_test x n_test covariance doesn't fit for large test sets.
+        with torch.no_grad():
+            test_outputs = model(testX)
+            predictions.append(gpytorch.distributions.MultivariateNormal(
+                test_outputs.mean.cpu(), gpytorch.lazy.DiagLazyTensor(test_outputs.variance.cpu())))
+        del model, test_outputs
+        if output_device.type == 'cuda':
+            torch.cuda.empty_cache()
 
+    testY = testY.cpu()
     test_outputs = ModelAverage(predictions, log_mlls)
     model_metrics = dict()
     with torch.no_grad():
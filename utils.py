@@ -1,3 +1,4 @@
+import os
 import gpytorch
 import torch
 import numpy as np
@@ -52,6 +53,13 @@ def format_for_str(num_or_list, decimals=3):
         return ''
 
 
+def _atomic_torch_save(obj, path):
+    """torch.save obj to path via a temporary file and a rename, so readers never see a partially written file"""
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
 @torch.jit.script
 def my_cdist(x1, x2):
     """from Jacob Gardner here https://github.com/pytorch/pytorch/issues/15253"""